@@ -1,25 +1,38 @@
 from enum import Enum, auto
 from dataclasses import dataclass, field
-from collections import namedtuple
-from typing import Any, Optional, Self
+from collections import deque, namedtuple
+from functools import lru_cache
+from typing import Final, Optional, Self
 
 import random
+import sys
 
 from prog_signal import VocabularyParsingError
 
 RECENT_WORDS_COUNT = 10
 MINIMUM_STREAK_DISPLAY = 5
-
-def obj_to_str(obj_str: Any) -> Optional[str]:
-    return obj_str if isinstance(obj_str, str) else None
-
-def obj_to_list_str(obj_ls: list) -> Optional[list[str]]:
-    return obj_ls if all(isinstance(o, str) for o in obj_ls) else None
-
-def obj_to_str_or_list_str(obj_s: Any) -> Optional[str | list[str]]:
-    return obj_to_list_str(obj_s) \
-            if isinstance(obj_s, list) \
-            else obj_to_str(obj_s)
+ELIGIBLE_WORDS_THRESHOLD = 10
+GUESSES_PER_WORD = 3
+
+# labels for the number of guesses left, indexed by that number
+GUESS_LABELS: Final[tuple[str, ...]] = (
+        "no guesses",
+        "1 guess",
+        *(f"{n} guesses" for n in range(2, GUESSES_PER_WORD + 1)),
+        )
+
+_CONGRATULATIONS: Final[tuple[str, ...]] = (
+        "That is correct!",
+        "Correct!",
+        "Well done!",
+        "This is proof of your genius",
+        )
+_COMISERATIONS: Final[tuple[str, ...]] = (
+        "Too bad!",
+        "Too difficult?",
+        "Oofie-doodle",
+        "You didn't get that one"
+        )
 
 class CategoryType(Enum):
     Unknown = auto()
@@ -31,43 +44,66 @@ def category_type_str_to_enum(s: str) -> CategoryType:
             "vocabulary": CategoryType.Vocabulary }
     return str_map.get(s, CategoryType.Unknown)
 
-@dataclass
+@dataclass(slots = True)
 class CategoryEntry:
-    data: dict[str, str | list[str]]
+    # (key, value) pairs in file order; vocab entries have exactly two
+    data: tuple[tuple[str, str | list[str]], ...]
 
     @classmethod
     def from_dict(cls: type[Self], d: dict) -> Self:
         '''Create from dictionary'''
-        data_kv_pairs = [
-                (obj_to_str(k), obj_to_str_or_list_str(v))
-                for k, v in d.items()]
-
-        return cls({
-            k: v for k, v in data_kv_pairs
-            if k is not None and v is not None})
-
-@dataclass
+        data: list[tuple[str, str | list[str]]] = []
+        # keys are language names repeated by every entry, so share them
+        intern = sys.intern
+        # json only produces exact str and list objects, so the cheaper
+        # type() identity checks are enough here
+        for k, v in d.items():
+            if type(k) is not str:
+                continue
+            match v:
+                case str():
+                    data.append((intern(k), v))
+                case list() if all(type(o) is str for o in v):
+                    data.append((intern(k), v))
+
+        return cls(tuple(data))
+
+@dataclass(slots = True)
 class Category:
     name: str
     type_: CategoryType
-    contents: list[CategoryEntry]
+    # entries are kept as json until the category is used; see load_contents
+    json_contents: list = field(repr = False)
+    contents: Optional[list[CategoryEntry]] = None
 
     @classmethod
     def from_dict(cls: type[Self], d: dict) -> Optional[Self]:
         '''Create from dictionary'''
-        if not isinstance(name := d.get("category_name", None), str):
-            return None
-        if not isinstance(type_ := d.get("category_type", None), str):
+        try:
+            name = d["category_name"]
+            type_ = d["category_type"]
+            entries = d["category_contents"]
+        except KeyError:
             return None
-        if not isinstance(entries := d.get("category_contents", None), list):
+        if not (isinstance(name, str)
+                and isinstance(type_, str)
+                and isinstance(entries, list)):
             return None
-        contents = (CategoryEntry.from_dict(entry) for entry in entries)
         return cls(
-                name,
+                sys.intern(name),
                 category_type_str_to_enum(type_),
-                [entry for entry in contents if entry is not None])
+                entries)
 
-@dataclass
+    def load_contents(self) -> list[CategoryEntry]:
+        '''Parse category entries on first use and return them'''
+        if self.contents is None:
+            # CategoryEntry.from_dict drops invalid items instead of failing
+            self.contents = [CategoryEntry.from_dict(entry) for entry in self.json_contents]
+            self.json_contents = []
+
+        return self.contents
+
+@dataclass(slots = True)
 class Class:
     name: str
     categories: list[Category]
@@ -75,104 +111,160 @@ class Class:
     @classmethod
     def from_dict(cls: type[Self], d: dict) -> Optional[Self]:
         '''Create from dictionary'''
-        if not isinstance(name := d.get("class_name", None), str):
+        try:
+            name = d["class_name"]
+            cat_dicts = d["categories"]
+        except KeyError:
             return None
-        if not isinstance(cat_dicts := d.get("categories", None), list):
+        if not (isinstance(name, str) and isinstance(cat_dicts, list)):
             return None
-        categories = (Category.from_dict(d) for d in cat_dicts)
-        return cls(
-                name,
-                [category for category in categories if category is not None])
+        categories: list[Category] = []
+        for cat_dict in cat_dicts:
+            category = Category.from_dict(cat_dict)
+            if category is not None:
+                categories.append(category)
+
+        return cls(name, categories)
+
+# words in file order for display, as a set for checking responses, and
+# joined for showing all of the answers
+Answers = namedtuple("Answers", "words lookup text")
 
 # NOTE: languages are structured like in the json file:
 #   spanish -> english (many -> one)
 # I'm just writing very generic code
-@dataclass
+@dataclass(slots = True)
 class PracticeSession:
     categories: list[Category]
     languages: tuple[str,str]
-    dictionary: dict[str,list[str]]
+    dictionary: dict[str,Answers]
 
     total_tests: int = 0
     streak: int = 0
     missed_words: list[str] = field(default_factory = list[str])
-    recent_words: list[str] = field(default_factory = list[str])
+    missed_words_set: set[str] = field(default_factory = set[str])
+    # recent words are stored as indices into the session's word tuple
+    recent_indices: deque[int] = field(
+            default_factory = lambda: deque(maxlen = RECENT_WORDS_COUNT))
+    recent_indices_set: set[int] = field(default_factory = set[int])
     practice_words: list[str] = field(default_factory=list[str])
-    use_recent_words = True
+    practice_words_set: set[str] = field(default_factory = set[str])
+    use_recent_words: bool = True
+    rng: random.Random = field(default_factory = random.Random)
+
+    # keys of the dictionary, which doesn't change during a session
+    _words: tuple[str, ...] = field(init = False, repr = False)
+
+    def __post_init__(self):
+        self._words = tuple(self.dictionary)
+
+        # with this few words every word would always be recent
+        self.use_recent_words = (self.use_recent_words
+                                 and len(self.dictionary) > RECENT_WORDS_COUNT)
 
 DictionaryEntry = namedtuple("DictionaryEntry", "languages translation words")
 LanguagesKey = tuple[str,str]
 
+@lru_cache(maxsize = 16)
+def languages_key(first: str, second: str) -> LanguagesKey:
+    '''Create languages key; equal language pairs share a single tuple'''
+    return (sys.intern(first), sys.intern(second))
+
 def vocab_entry_to_dictionary_entry(entry: CategoryEntry) -> DictionaryEntry:
     '''Create entry for language dictionary (languages, translation, words)'''
     data = entry.data
-    keys = list(data.keys())
-    if len(keys) != 2:
-        raise VocabularyParsingError(f"Vocab entry is structured incorrectly: {data=}")
+    try:
+        (k0, v0), (k1, v1) = data
+    except ValueError:
+        raise VocabularyParsingError(f"Vocab entry is structured incorrectly: {data=}") from None
 
     # depends implicitly on data values being str | list[str]
     #   two assumptions:
     #       - there are only two variants
     #       - the list variant is always a list of strings
-    if isinstance(data[keys[0]], list) and isinstance(data[keys[1]], list):
-        raise VocabularyParsingError(f"Vocab entry is structured incorrectly: {data=}")
-    elif isinstance(data[keys[0]], list):
-        return DictionaryEntry((keys[0],keys[1]), data[keys[1]], data[keys[0]])
-    elif isinstance(data[keys[1]], list):
-        return DictionaryEntry((keys[1],keys[0]), data[keys[0]], data[keys[0]])
-    else:
-        raise VocabularyParsingError(f"Vocab entry is structured incorrectly: {data=}")
-
-def make_language_dictionary(categories: list[Category]) -> dict[LanguagesKey, dict[str, list[str]]]:
+    match v0, v1:
+        case list(), str():
+            return DictionaryEntry(languages_key(k0, k1), v1, v0)
+        case str(), list():
+            return DictionaryEntry(languages_key(k1, k0), v0, v1)
+        case _:
+            raise VocabularyParsingError(f"Vocab entry is structured incorrectly: {data=}")
+
+def make_language_dictionary(categories: list[Category]) -> dict[LanguagesKey, dict[str, Answers]]:
     '''Create language dictionary for practice session'''
-    dispatch_type_map = {
-            CategoryType.Vocabulary: vocab_entry_to_dictionary_entry,
-            }
+    dictionary: dict[LanguagesKey, dict[str, Answers]] = {}
 
-    dictionary: dict[LanguagesKey, dict[str, list[str]]] = {}
-    def get_language_dict(languages: LanguagesKey) -> dict[str, list[str]]:
-        results = dictionary.get(languages, None)
-        if results is None:
-            results = {}
-            dictionary[languages] = results
+    # bound once since they are used for every entry
+    dictionary_get = dictionary.get
+    intern = sys.intern
 
-        return results
+    # consecutive entries almost always share a language pair, and
+    # languages_key hands out the same tuple for it each time
+    last_languages: LanguagesKey | None = None
+    lang_dict: dict[str, Answers] = {}
 
     for category in categories:
-        convert_fn = dispatch_type_map.get(category.type_, None)
-        if convert_fn is None:
+        if category.type_ is not CategoryType.Vocabulary:
             print(f"Category '{category.name}' has an unknown type")
             continue
 
-        for entry in category.contents:
-            languages, translation, words = convert_fn(entry)
-            lang_dict = get_language_dict(languages)
-            lang_dict[translation] = words
+        entries = map(vocab_entry_to_dictionary_entry, category.load_contents())
+        for languages, translation, words in entries:
+            if languages is not last_languages:
+                existing = dictionary_get(languages)
+                if existing is None:
+                    existing = {}
+                    dictionary[languages] = existing
+
+                lang_dict = existing
+                last_languages = languages
+
+            lang_dict[intern(translation)] = Answers(
+                    tuple(words), frozenset(words), " or ".join(words))
 
     return dictionary
 
-def add_to_recent_words(word: str, session: PracticeSession) -> None:
-    '''Add word to list of recent words, trimming the list if required'''
+def add_to_missed_words(word: str, session: PracticeSession) -> None:
+    '''Add word to missed words if it isn't already there, keeping order'''
+    if word not in session.missed_words_set:
+        session.missed_words_set.add(word)
+        session.missed_words.append(word)
+
+def add_to_practice_words(word: str, session: PracticeSession) -> None:
+    '''Add word to practice words if it isn't already there, keeping order'''
+    if word not in session.practice_words_set:
+        session.practice_words_set.add(word)
+        session.practice_words.append(word)
+
+def add_to_recent_words(index: int, session: PracticeSession) -> None:
+    '''Add word index to recent words, dropping the oldest if required'''
     if not session.use_recent_words:
         return
 
-    if len(list(session.dictionary.keys())) <= RECENT_WORDS_COUNT:
-        session.use_recent_words = False
-        return
+    # deque drops the oldest index itself, so only the set needs trimming
+    if len(session.recent_indices) == RECENT_WORDS_COUNT:
+        session.recent_indices_set.discard(session.recent_indices[0])
 
-    session.recent_words.append(word)
-    if len(session.recent_words) > RECENT_WORDS_COUNT:
-        session.recent_words.pop(0)
+    session.recent_indices.append(index)
+    session.recent_indices_set.add(index)
 
 def get_random_word(session: PracticeSession) -> str:
     '''Get random word that hasn't recently been seen'''
-    fn = lambda: random.choice(list(session.dictionary.keys()))
-    word = fn()
-    while word in session.recent_words:
-        word = fn()
+    words = session._words
+    recent = session.recent_indices_set
+    n_words = len(words)
+    if n_words - len(recent) < ELIGIBLE_WORDS_THRESHOLD:
+        # most words are recent, so pick from the eligible ones directly
+        # rather than retrying until a non-recent word comes up
+        index = session.rng.choice([i for i in range(n_words) if i not in recent])
+    else:
+        randrange = session.rng.randrange
+        index = randrange(n_words)
+        while index in recent:
+            index = randrange(n_words)
 
-    add_to_recent_words(word, session)
-    return word
+    add_to_recent_words(index, session)
+    return words[index]
 
 g_shuffled_words: list[str] = []
 
@@ -180,28 +272,15 @@ def get_shuffled_word(session: PracticeSession) -> str:
     '''Get random word by shuffling words'''
     global g_shuffled_words
     if len(g_shuffled_words) == 0:
-        g_shuffled_words = list(session.dictionary.keys())
-        random.shuffle(g_shuffled_words)
+        g_shuffled_words = list(session._words)
+        session.rng.shuffle(g_shuffled_words)
 
     return g_shuffled_words.pop()
 
-def congratulation() -> str:
-    '''Random congratulation'''
-    congratulations = (
-            "That is correct!",
-            "Correct!",
-            "Well done!",
-            "This is proof of your genius",
-            )
-    return random.choice(congratulations)
-
-def comiseration() -> str:
-    '''Random comiseration'''
-    comiserations = (
-            "Too bad!",
-            "Too difficult?",
-            "Oofie-doodle",
-            "You didn't get that one"
-            )
-    return random.choice(comiserations)
+def congratulation(rng: Optional[random.Random] = None) -> str:
+    '''Random congratulation; rng defaults to the random module's generator'''
+    return (rng or random).choice(_CONGRATULATIONS)
 
+def comiseration(rng: Optional[random.Random] = None) -> str:
+    '''Random comiseration; rng defaults to the random module's generator'''
+    return (rng or random).choice(_COMISERATIONS)
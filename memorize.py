@@ -1,17 +1,20 @@
 from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Iterable, TypeVar
+from typing import Any, Optional, TypeVar
 
 import importlib.util
+import itertools
 import json
-import random
-import re
+import os
+import sys
 
 from data import (
-        Category, Class, LanguagesKey, MINIMUM_STREAK_DISPLAY, PracticeSession,
-        RECENT_WORDS_COUNT, comiseration, congratulation, make_language_dictionary)
+        Category, Class, GUESSES_PER_WORD, GUESS_LABELS, LanguagesKey, MINIMUM_STREAK_DISPLAY,
+        PracticeSession, add_to_missed_words, add_to_practice_words, comiseration,
+        congratulation, get_shuffled_word, make_language_dictionary)
 from prog_signal import UserQuit, UserDefaultSelection
-from memorize_tui import run_main_tui_mode
 
 USE_CURSES: bool
 if importlib.util.find_spec("curses") is not None:  # does curses exist
@@ -19,69 +22,172 @@ if importlib.util.find_spec("curses") is not None:  # does curses exist
 else:
     USE_CURSES = False
 
+USE_ORJSON: bool
+if importlib.util.find_spec("orjson") is not None:  # faster json parser
+    import orjson
+    USE_ORJSON = True
+else:
+    USE_ORJSON = False
+
 FILES_DIR = Path("./memorize_files/")
-CLASS_FILE_GLOB_PATTERN = "*.json"
-CATEGORY_SELECT_PATTERN = re.compile(r"^(\d+)[.:]((\d+)(-(\d+))?|\*)$")
+CLASS_FILE_SUFFIX = ".json"
 DEFAULT_NUMBER_OF_ROUNDS = 10
+MAX_LOAD_WORKERS = 32
+# right-aligned answer prompts, indexed by the number of guesses left
+ANSWER_PROMPTS = tuple(f"Answer ({label} left)".rjust(30) + ": " for label in GUESS_LABELS)
 
 T = TypeVar('T')
 
 def load_class_file(path: Path) -> Any:
+    if USE_ORJSON:
+        return orjson.loads(path.read_bytes())
+
     result: Any = None
     with open(path) as file:
         result = json.load(file)
     return result
 
+def load_class(path: Path) -> Optional[Class]:
+    '''Load class from file; the decoded json is dropped once converted'''
+    return Class.from_dict(load_class_file(path))
+
+def find_class_files() -> list[Path]:
+    '''List class files in name order'''
+    # scandir entries carry their file type, so only symlinks need a stat
+    try:
+        with os.scandir(FILES_DIR) as entries:
+            names = sorted(
+                    entry.name for entry in entries
+                    if entry.name.endswith(CLASS_FILE_SUFFIX)
+                    and entry.is_file())
+    except FileNotFoundError:
+        return []
+    return [FILES_DIR / name for name in names]
+
 def load_classes() -> list[Class]:
-    class_file_paths = sorted(FILES_DIR.glob(CLASS_FILE_GLOB_PATTERN))
-    json_classes = [load_class_file(path) for path in class_file_paths]
-    classes = [Class.from_dict(json_class) for json_class in json_classes]
-    return [class_ for class_ in classes if class_ is not None]
+    class_file_paths = find_class_files()
+    # reading files is I/O bound, so load them concurrently; map keeps the
+    # results in path order
+    max_workers = min(MAX_LOAD_WORKERS, len(class_file_paths) or 1)
+    with ThreadPoolExecutor(max_workers = max_workers) as executor:
+        classes = executor.map(load_class, class_file_paths)
+        return [class_ for class_ in classes if class_ is not None]
 
 # note that indices in the selection are 1-based
 def print_category_selection_screen(classes: list[Class]) -> None:
-    print("The following classes are available:\n")
+    # build the screen up front so that it is written in one go
+    lines = ["The following classes are available:\n"]
     for class_index,class_ in enumerate(classes):
-        print(f"{class_index + 1}. {class_.name}")
+        lines.append(f"{class_index + 1}. {class_.name}")
         for category_index,category in enumerate(class_.categories):
-            print(f"\t{class_index + 1}.{category_index + 1} {category.name}")
+            lines.append(f"\t{class_index + 1}.{category_index + 1} {category.name}")
 
-        print()
+        lines.append("")
 
-# note that indices in the selection are 1-based
-def selection_string_to_indices(response: str, classes: list[Class]) -> list[tuple[int,int]]:
-    '''Parse selection string into category indices'''
-    max_class_index = len(classes) - 1
+    sys.stdout.write("\n".join(lines) + "\n")
+
+SelectionGroups = tuple[str, Optional[str], Optional[str], Optional[str]]
+
+def is_decimal_number(s: str) -> bool:
+    '''Check if string is a non-empty run of decimal digits, as matched by \\d'''
+    return s.isdecimal()
+
+def parse_number(s: str) -> Optional[int]:
+    '''Parse a number the way int() does; Return None if it isn't one'''
+    try:
+        return int(s)
+    except ValueError:
+        return None
 
-    choices: set[tuple[int,int]] = set()
+def split_selection(selection: str) -> Optional[SelectionGroups]:
+    '''Split selection into (class, categories, category start, category end)
+
+    categories is the whole text after the separator, e.g. '*' or '2-4'
+
+    Return None if the selection is invalid'''
+    class_str, sep, category_str = selection.partition('.')
+    if not sep:
+        class_str, sep, category_str = selection.partition(':')
+
+    if sep and is_decimal_number(class_str):
+        if category_str == '*':
+            return (class_str, '*', None, None)
+
+        start, dash, end = category_str.partition('-')
+        if is_decimal_number(start) and not dash:
+            return (class_str, category_str, start, None)
+        if is_decimal_number(start) and is_decimal_number(end):
+            return (class_str, category_str, start, end)
+
+    return None
+
+# note that indices in the selection are 1-based
+@lru_cache(maxsize = 128)
+def parse_selection_string(
+        response: str,
+        classes_shape: tuple[int, ...]
+        ) -> tuple[tuple[tuple[int,int], ...], tuple[str, ...]]:
+    '''Parse selection string into sorted category indices and error messages
+
+    classes_shape holds the number of categories in each class'''
+    max_class_index = len(classes_shape) - 1
+
+    # one bit per selected category in each class, so that duplicates merge
+    # and decoding the bits low to high gives sorted indices
+    masks: list[int] = [0] * len(classes_shape)
+    messages: list[str] = []
     for selection in response.split():
-        match = CATEGORY_SELECT_PATTERN.match(selection)
-        if match is None:
-            print(f"'{selection} is an invalid selection")
+        groups = split_selection(selection)
+        if groups is None:
+            messages.append(f"'{selection} is an invalid selection")
             continue
 
-        cls_idx, wild, cat_start, _, cat_end = match.groups()
-        class_index = int(cls_idx) - 1 # can't fail because pattern always matches digits
+        cls_idx, wild, cat_start, cat_end = groups
+        class_index = int(cls_idx) - 1 # can't fail because class is always digits
         if class_index < 0 or class_index > max_class_index:
-            print(f"Class {class_index} is out of range (maximum is {max_class_index})")
+            messages.append(f"Class {class_index} is out of range (maximum is {max_class_index})")
             continue
 
-        range_: Iterable[int]
+        n_categories = classes_shape[class_index]
+        start: int
+        stop: int   # exclusive
         if wild == '*':
-            range_ = range(0, len(classes[class_index].categories))
+            start, stop = 0, n_categories
         elif cat_end is not None:
-            range_ = range(int(cat_start) - 1, int(cat_end)) # range doesn't include stop
+            start, stop = int(cat_start) - 1, int(cat_end)
         else:
-            range_ = range(int(cat_start) - 1, int(cat_start))
+            start = int(cat_start) - 1
+            stop = start + 1
 
-        for category_index in range_:
-            choices.add((class_index,category_index))
+        if start < 0 or stop > n_categories:
+            messages.append(f"'{selection}' is out of range (class {class_index + 1} "
+                            f"has {n_categories} categories)")
+            continue
+
+        if start < stop:
+            masks[class_index] |= ((1 << (stop - start)) - 1) << start
+
+    choices: list[tuple[int,int]] = []
+    for class_index, mask in enumerate(masks):
+        while mask:
+            lowest_bit = mask & -mask
+            choices.append((class_index, lowest_bit.bit_length() - 1))
+            mask ^= lowest_bit
+
+    return tuple(choices), tuple(messages)
+
+def selection_string_to_indices(response: str, classes: list[Class]) -> list[tuple[int,int]]:
+    '''Parse selection string into category indices'''
+    classes_shape = tuple(len(class_.categories) for class_ in classes)
+    choices, messages = parse_selection_string(response, classes_shape)
+    for message in messages:
+        print(message)
 
     if len(choices) == 0:
         print("No selection could be made")
         raise UserQuit
 
-    return sorted(choices)
+    return list(choices)
 
 def select_categories_from_classes_interactively(classes: list[Class]) -> list[Category]:
     '''Prompt user to select categories from list'''
@@ -101,10 +207,8 @@ def select_categories_from_classes_interactively(classes: list[Class]) -> list[C
 def select_default_categories(classes: list[Class]) -> list[Category]:
     '''Default category selection'''
     print("Selecting everything...")
-    categories: list[Category] = []
-    for class_ in classes:
-        categories += class_.categories
-    return categories
+    return list(itertools.chain.from_iterable(
+        class_.categories for class_ in classes))
 
 def select_language_interactively(languages_keys: list[LanguagesKey]) -> LanguagesKey:
     '''Prompt user to select the session language'''
@@ -120,21 +224,20 @@ def select_language_interactively(languages_keys: list[LanguagesKey]) -> Languag
     print()
     choice: int | None = None
     while choice is None:
-        response = ''
-        try:
-            print("Enter your selection: ('q' quits) ", end = '')
-            response = input()
-
-            if response.lower() == 'q':
-                raise UserQuit
+        print("Enter your selection: ('q' quits) ", end = '')
+        response = input()
 
-            choice = int(response)
-            if choice < 1 or choice > len(languages_keys):
-                print(f"Choice out of range: {choice}")
-                choice = None
+        if response.lower() == 'q':
+            raise UserQuit
 
-        except ValueError:
+        choice = parse_number(response)
+        if choice is None:
             print(f"Invalid response '{response}'")
+            continue
+
+        if choice < 1 or choice > len(languages_keys):
+            print(f"Choice out of range: {choice}")
+            choice = None
 
     return languages_keys[choice - 1]
 
@@ -146,7 +249,7 @@ def configure_session_interactively(classes: list[Class]) -> PracticeSession:
         categories = select_default_categories(classes)
 
     dictionary = make_language_dictionary(categories)
-    languages = select_language_interactively(list(dictionary.keys()))
+    languages = select_language_interactively(list(dictionary))
     return PracticeSession(categories, languages, dictionary[languages])
 
 def ask_rounds() -> int:
@@ -160,90 +263,34 @@ def ask_rounds() -> int:
 
     choice = None
     while choice is None:
-        response = ''
-        try:
-            print("Enter your selection: ('q' quits) ", end = '')
-            response = input()
+        print("Enter your selection: ('q' quits) ", end = '')
+        response = input()
 
-            if response == '':
-                print(f"Defaulting to {DEFAULT_NUMBER_OF_ROUNDS} rounds\n")
-                return DEFAULT_NUMBER_OF_ROUNDS
+        if response == '':
+            print(f"Defaulting to {DEFAULT_NUMBER_OF_ROUNDS} rounds\n")
+            return DEFAULT_NUMBER_OF_ROUNDS
 
-            if response.lower() == 'q':
-                raise UserQuit
+        if response.lower() == 'q':
+            raise UserQuit
 
-            choice = int(response)
-            if choice < 1 or choice > 4:
-                if choice in selection:
-                    print()
-                    return choice
+        choice = parse_number(response)
+        if choice is None:
+            print(f"Invalid response: '{response}'")
+            continue
 
-                print(f"Choice out of range: {choice}")
-                choice = None
+        if choice < 1 or choice > 4:
+            if choice in selection:
+                print()
+                return choice
 
-        except ValueError:
-            print(f"Invalid response: '{response}'")
+            print(f"Choice out of range: {choice}")
+            choice = None
 
     print()
     return selection[choice - 1]
 
-def congratulation() -> str:
-    '''Random congratulation'''
-    congratulations = (
-            "That is correct!",
-            "Correct!",
-            "Well done!",
-            "This is proof of your genius",
-            )
-    return random.choice(congratulations)
-
-def comiseration() -> str:
-    '''Random comiseration'''
-    comiserations = (
-            "Too bad!",
-            "Too difficult?",
-            "Oofie-doodle",
-            "You didn't get that one"
-            )
-    return random.choice(comiserations)
-
-def add_to_recent_words(word: str, session: PracticeSession) -> None:
-    '''Add word to list of recent words, trimming the list if required'''
-    if not session.use_recent_words:
-        return
-
-    if len(list(session.dictionary.keys())) <= RECENT_WORDS_COUNT:
-        session.use_recent_words = False
-        return
-
-    session.recent_words.append(word)
-    if len(session.recent_words) > RECENT_WORDS_COUNT:
-        session.recent_words.pop(0)
-
-def get_random_word(session: PracticeSession) -> str:
-    '''Get random word that hasn't recently been seen'''
-    fn = lambda: random.choice(list(session.dictionary.keys()))
-    word = fn()
-    while word in session.recent_words:
-        word = fn()
-
-    add_to_recent_words(word, session)
-    return word
-
-g_shuffled_words: list[str] = []
-
-def get_shuffled_word(session: PracticeSession) -> str:
-    '''Get random word by shuffling words'''
-    global g_shuffled_words
-    if len(g_shuffled_words) == 0:
-        g_shuffled_words = list(session.dictionary.keys())
-        random.shuffle(g_shuffled_words)
-
-    return g_shuffled_words.pop()
-
 def play_memorize_round(session: PracticeSession) -> None:
     '''Play round of Memorize'''
-    #word = get_random_word(session)
     word = get_shuffled_word(session)
     answers = session.dictionary[word]
 
@@ -251,15 +298,12 @@ def play_memorize_round(session: PracticeSession) -> None:
         print(f"{'Streak':>30}: {session.streak}")
 
     print(f"{'Your word is':>30}: {word}")
-    guesses_left = 3
-    display_guesses = lambda: f"{guesses_left} guesses" \
-            if guesses_left > 1 else "1 guess"
+    guesses_left = GUESSES_PER_WORD
 
     session.total_tests += 1
 
     while guesses_left > 0:
-        display_prompt = f"Answer ({display_guesses()} left)"
-        print(f"{display_prompt:>30}: ", end = '')
+        print(ANSWER_PROMPTS[guesses_left], end = '')
         response = input()
 
         if response == '':
@@ -270,12 +314,12 @@ def play_memorize_round(session: PracticeSession) -> None:
 
             continue
 
-        if response in answers:
+        if response in answers.lookup:
             session.streak += 1
 
-            print(f"\n{congratulation()}")
-            if len(answers) > 1:
-                other_answers = (answer for answer in answers if answer != response)
+            print(f"\n{congratulation(session.rng)}")
+            if len(answers.words) > 1:
+                other_answers = [answer for answer in answers.words if answer != response]
                 print(f"Other answers could have been {' or '.join(other_answers)}")
 
             print()
@@ -286,16 +330,14 @@ def play_memorize_round(session: PracticeSession) -> None:
             session.streak = 0
             guesses_left -= 1
 
-            if word not in session.practice_words:
-                session.practice_words.append(word)
+            add_to_practice_words(word, session)
 
-    if len(answers) == 1:
-        print(f"\n{comiseration()}\nThe correct answer was {answers[0]}\n")
+    if len(answers.words) == 1:
+        print(f"\n{comiseration(session.rng)}\nThe correct answer was {answers.words[0]}\n")
     else:
-        print(f"\n{comiseration()}\nThe correct answers were {' or '.join(answers)}\n")
+        print(f"\n{comiseration(session.rng)}\nThe correct answers were {answers.text}\n")
 
-    if word not in session.missed_words:
-        session.missed_words.append(word)
+    add_to_missed_words(word, session)
 
 def play_memorize_game(session: PracticeSession) -> None:
     '''Play Memorize game'''
@@ -322,16 +364,12 @@ def main_terminal_mode(classes: list[Class]) -> None:
     if len(session.missed_words) == 0:
         print("There were no missed words")
     else:
-        print(f"Missed words:")
-        for word in session.missed_words:
-            print(f"\t{word}")
+        print("Missed words:\n" + "\n".join(f"\t{word}" for word in session.missed_words))
 
     if len(session.practice_words) == 0:
         print("\nThere are no words to practice")
     else:
-        print("\nWords to practice:")
-        for word in session.practice_words:
-            print(f"\t{word}")
+        print("\nWords to practice:\n" + "\n".join(f"\t{word}" for word in session.practice_words))
 
     input()
 
@@ -347,6 +385,8 @@ def main():
         main_terminal_mode(classes)
 
     else:
+        # imported here so that terminal mode doesn't need to load curses
+        from memorize_tui import run_main_tui_mode
         try:
             run_main_tui_mode(classes)
 
@@ -1,12 +1,15 @@
 from tui import (
-         AcceleratorMap, CheckboxMenu, Layout, MenuScreen, ScreenBase, TUI_BEGIN_STATE,
-         TUI_END_STATE, TUI_KEY_BACKSPACE, TUI_KEY_DOWN, TUI_KEY_ENTER, TUI_KEY_EVENT,
-         TUI_KEY_UP, TUI_OK_EVENT, TuiContext, TuiKey, TuiProgram, as_ctrl_key, as_key,
-         key_to_str, on_quit)
+         AcceleratorHandle, AcceleratorMap, CheckboxMenu, Layout, MenuScreen, ScreenBase,
+         TUI_BEGIN_STATE, TUI_END_STATE, TUI_KEY_BACKSPACE, TUI_KEY_DOWN, TUI_KEY_ENTER,
+         TUI_KEY_EVENT, TUI_KEY_UP, TUI_OK_EVENT, TuiContext, TuiKey, TuiProgram, as_ctrl_key,
+         as_key, key_to_str, on_quit)
 from data import (
-        Category, Class, LanguagesKey, MINIMUM_STREAK_DISPLAY, PracticeSession,
+        Answers, Category, Class, GUESSES_PER_WORD, GUESS_LABELS, LanguagesKey,
+        MINIMUM_STREAK_DISPLAY, PracticeSession, add_to_missed_words, add_to_practice_words,
         comiseration, congratulation, make_language_dictionary, get_shuffled_word)
 
+from functools import lru_cache
+
 import curses
 
 SELECT_LANG_STATE = TUI_BEGIN_STATE + 1
@@ -16,6 +19,20 @@ PLAY_MEMORIZE_STATE = SELECT_ROUNDS_STATE + 1
 SELECT_MORE_ROUNDS_STATE = PLAY_MEMORIZE_STATE + 1
 SUMMARY_STATE = SELECT_MORE_ROUNDS_STATE + 1
 
+# answer prompts, indexed by the number of guesses left
+ANSWER_PROMPTS = tuple(f"Answer ({label} left):" for label in GUESS_LABELS)
+
+# menu entry strings are cached as the menus are rebuilt for every session
+@lru_cache(maxsize = None)
+def display_languages_key(key: LanguagesKey) -> str:
+    '''String display helper for language pair'''
+    return f"{key[1]} -> {key[0]}"
+
+@lru_cache(maxsize = None)
+def display_rounds(rounds: int) -> str:
+    '''String display helper for number of rounds; 0 rounds finishes'''
+    return f"{rounds} rounds" if rounds > 0 else "Finish"
+
 class CategorySelectionScreen(ScreenBase):
     '''Form for selecting cateogries from classes'''
 
@@ -67,14 +84,15 @@ class CategorySelectionScreen(ScreenBase):
         '''Destroy UI widgets and bindings and set program data'''
         self.accel_map.remove_from_tui(tui)
 
-        categories: list[Category] = []
-        for menu_index, menu in enumerate(self.menus):
-            for entry_index, entry in enumerate(menu.entries):
-                if entry.enabled:
-                    categories.append(self.classes[menu_index].categories[entry_index])
+        # there is one menu per class and one entry per category
+        categories: list[Category] = [
+                class_.categories[entry_index]
+                for class_, menu in zip(self.classes, self.menus, strict = True)
+                for entry_index, entry in enumerate(menu.entries)
+                if entry.enabled]
 
-        dictionary: dict[LanguagesKey, dict[str, list[str]]] = make_language_dictionary(categories)
-        if len(dictionary.keys()) == 0:
+        dictionary: dict[LanguagesKey, dict[str, Answers]] = make_language_dictionary(categories)
+        if len(dictionary) == 0:
             # TODO: handle empty dictionary
             raise NotImplementedError
 
@@ -118,8 +136,7 @@ class CategorySelectionScreen(ScreenBase):
         t.emit(TUI_OK_EVENT)
 
     def on_space(self, t: TuiContext):
-        entry = self.menus[self.cur_menu_idx].entries[self.cur_entry_idx]
-        entry.enabled = not entry.enabled
+        entry = self.menus[self.cur_menu_idx].toggle_entry(self.cur_entry_idx)
         t.redraw()
         t.move_cursor(*entry.rendered_cursor_pos)
 
@@ -131,8 +148,8 @@ class LanguageSelectionScreen(ScreenBase):
 
     def __init__(self, prog_data: dict):
         self.prog_data = prog_data
-        self.dictionary: dict[LanguagesKey, dict[str, list[str]]] = prog_data["dictionary"]
-        self.languages_keys: list[LanguagesKey] = list(self.dictionary.keys())
+        self.dictionary: dict[LanguagesKey, dict[str, Answers]] = prog_data["dictionary"]
+        self.languages_keys: list[LanguagesKey] = list(self.dictionary)
 
         self.screen: MenuScreen | None
         if len(self.languages_keys) == 1:
@@ -143,7 +160,7 @@ class LanguageSelectionScreen(ScreenBase):
                     prog_data=self.prog_data,
                     items=self.languages_keys,
                     title="Select a language pair:",
-                    item_display_fn=lambda k: f"{k[1]} -> {k[0]}")
+                    item_display_fn=display_languages_key)
 
     def draw(self, tui: TuiContext) -> None:
         '''Draw calls to render screen if screen was set'''
@@ -168,7 +185,7 @@ class LanguageSelectionScreen(ScreenBase):
             self.prog_data["languages"] = self.prog_data["selection"]
 
         categories: list[Category] = self.prog_data["categories"]
-        dictionary: dict[LanguagesKey, dict[str, list[str]]] = self.prog_data["dictionary"]
+        dictionary: dict[LanguagesKey, dict[str, Answers]] = self.prog_data["dictionary"]
         languages: LanguagesKey = self.prog_data["languages"]
         self.prog_data["session"] = PracticeSession(
                 categories, languages, dictionary[languages])
@@ -182,7 +199,7 @@ class RoundsSelectionScreen(ScreenBase):
                 self.prog_data,
                 items=(5, 10, 20, 50),
                 title="How many rounds?",
-                item_display_fn=lambda n: f"{n} rounds",
+                item_display_fn=display_rounds,
                 start_index=1)
 
     def draw(self, tui: TuiContext) -> None:
@@ -217,10 +234,10 @@ class PlayMemorizeScreen(ScreenBase):
         self.answers = self.session.dictionary[self.word]
         self.session.total_tests += 1
 
-        self.guesses_left = 3
+        self.guesses_left = GUESSES_PER_WORD
 
         self.title = self.display_title()
-        self.answer_prompt = f"Answer ({self.display_guesses(self.guesses_left)} left):"
+        self.answer_prompt = ANSWER_PROMPTS[self.guesses_left]
         self.answer_response = ""
         self.feedback_1 = ""
         self.feedback_2 = ""
@@ -263,6 +280,9 @@ class PlayMemorizeScreen(ScreenBase):
             tui.emit(TUI_OK_EVENT)
             return
 
+        # special keys handled by the entry; other keys are typed into it
+        self.special_key_handlers: dict[TuiKey, AcceleratorHandle] = {
+                TUI_KEY_BACKSPACE: self.on_backspace }
         tui.add_callback(TUI_KEY_EVENT, self.on_entry_key_press)
         tui.add_callback("text_changed", self.on_text_changed)
         tui.add_callback("submit", self.on_submit)
@@ -295,22 +315,30 @@ class PlayMemorizeScreen(ScreenBase):
         if self.state != GAME_GUESSING:
             return True
 
+        handler = self.special_key_handlers.get(k)
+        if handler is not None:
+            handler(t)
+            return True
+
         key_str = key_to_str(k)
-        if k == TUI_KEY_BACKSPACE and len(self.answer_response) == 0:
-            pass
-        elif k == TUI_KEY_BACKSPACE:
-            t.clear_screen() # anticipate needing to redraw
-            self.answer_response = self.answer_response[:-1]
-            t.emit("text_changed")
-        elif len(key_str) > 1: # key is special key
-            pass
-        else:
+        if len(key_str) == 1: # anything longer is a special key
             self.answer_response = self.answer_response + key_str
             t.emit("text_changed")
         return True
 
+    def on_backspace(self, t: TuiContext):
+        if len(self.answer_response) == 0:
+            return
+
+        self.answer_response = self.answer_response[:-1]
+        t.emit("text_changed")
+
     def on_text_changed(self, t: TuiContext, _) -> bool:
-        t.redraw()
+        # only the entry line changes while typing, unless it outgrows the
+        # layout and everything has to be centred again
+        if not self.layout.redraw_target(t, self.entry):
+            t.clear_screen()
+            t.redraw()
         self.move_cursor_to_entry(t)
         return True
 
@@ -331,11 +359,11 @@ class PlayMemorizeScreen(ScreenBase):
 
     def correct(self, t: TuiContext):
         self.session.streak += 1
-        self.feedback_1 = congratulation()
-        if len(self.answers) > 1:
-            other_answers = ( answer
-                             for answer in self.answers
-                             if answer != self.answer_response)
+        self.feedback_1 = congratulation(self.session.rng)
+        if len(self.answers.words) > 1:
+            other_answers = [ answer
+                             for answer in self.answers.words
+                             if answer != self.answer_response ]
             self.feedback_2 = f"Other answers could have been {' or '.join(other_answers)}"
 
         self.state = GAME_WORD_GUESSED
@@ -350,18 +378,18 @@ class PlayMemorizeScreen(ScreenBase):
 
         self.guesses_left -= 1
         if self.guesses_left == 0:
-            self.answer_prompt = f"Answer ({self.display_guesses(self.guesses_left)} left):"
-            self.feedback_1 = comiseration()
-            if len(self.answers) > 1:
-                self.feedback_2 = f"The correct answers were {' or '.join(self.answers)}"
+            self.answer_prompt = ANSWER_PROMPTS[self.guesses_left]
+            self.feedback_1 = comiseration(self.session.rng)
+            if len(self.answers.words) > 1:
+                self.feedback_2 = f"The correct answers were {self.answers.text}"
             else:
-                self.feedback_2 = f"The correct answer was {self.answers[0]}"
+                self.feedback_2 = f"The correct answer was {self.answers.words[0]}"
             self.state = GAME_WORD_MISSED
             t.redraw()
             self.move_cursor_to_entry(t)
 
         else:
-            self.answer_prompt = f"Answer ({self.display_guesses(self.guesses_left)} left):"
+            self.answer_prompt = ANSWER_PROMPTS[self.guesses_left]
             self.feedback_1 = "Incorrect"
             self.feedback_2 = "Press Enter to retry..."
             t.clear_screen()
@@ -369,18 +397,17 @@ class PlayMemorizeScreen(ScreenBase):
             self.move_cursor_to_entry(t)
             self.state = GAME_WAITING_TO_RETRY
 
-            if self.word not in self.session.practice_words:
-                self.session.practice_words.append(self.word)
+            add_to_practice_words(self.word, self.session)
 
     def on_submit(self, t: TuiContext, _) -> bool:
-        if self.answer_response.lower().strip() in self.answers:
+        if self.answer_response.lower().strip() in self.answers.lookup:
             self.correct(t)
         else:
             self.wrong(t)
         return True
 
     def on_retry(self, t: TuiContext, _) -> bool:
-        self.answer_prompt = f"Answer ({self.display_guesses(self.guesses_left)} left):"
+        self.answer_prompt = ANSWER_PROMPTS[self.guesses_left]
         self.answer_response = ""
         self.feedback_1 = ""
         self.feedback_2 = ""
@@ -391,20 +418,12 @@ class PlayMemorizeScreen(ScreenBase):
         return True
 
     def on_finish(self, t: TuiContext, _) -> bool:
-        if self.state == GAME_WORD_MISSED and self.word not in self.session.missed_words:
-            self.session.missed_words.append(self.word)
+        if self.state == GAME_WORD_MISSED:
+            add_to_missed_words(self.word, self.session)
 
         t.emit(TUI_OK_EVENT)
         return True
 
-    def display_guesses(self, guesses: int) -> str:
-        '''String display helper for number of guesses left'''
-        if guesses > 1:
-            return f"{guesses} guesses"
-        if guesses == 1:
-            return "1 guess"
-        return "no guesses"
-
     def display_title(self) -> str:
         '''String display helper for title'''
         if self.session.streak < MINIMUM_STREAK_DISPLAY:
@@ -424,7 +443,7 @@ class MoreRoundsSelectionScreen(ScreenBase):
                 self.prog_data,
                 items=(0, 5, 10, 20, 50),
                 title="How many rounds?",
-                item_display_fn=lambda n: f"{n} rounds" if n > 0 else "Finish")
+                item_display_fn=display_rounds)
 
     def draw(self, tui: TuiContext) -> None:
         self.screen.draw(tui)
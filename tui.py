@@ -1,6 +1,8 @@
 from abc import ABC, abstractmethod
+from collections import deque
 from dataclasses import dataclass, field
 from enum import Enum, auto
+from functools import lru_cache
 from typing import Callable, Self, Any, Iterable, TypeVar, Sequence
 
 import curses
@@ -17,11 +19,22 @@ TUI_KEY_ENTER     = ((curses.KEY_ENTER,),
                      (curses.ascii.CR,))
 TUI_KEY_BACKSPACE = (curses.KEY_BACKSPACE,)
 
+# application colour pairs (foreground, background) NOTE: hardcoded for now
+TUI_COLOUR_PAIRS = ((curses.COLOR_CYAN, curses.COLOR_BLACK),
+                    (curses.COLOR_RED, curses.COLOR_BLACK),
+                    (curses.COLOR_BLACK, curses.COLOR_WHITE))
+
+TUI_CHECKBOX_ON  = "[X] "
+TUI_CHECKBOX_OFF = "[ ] "
+
 TUI_KEY_EVENT = ""
 TUI_OK_EVENT = "ok"
 
 TuiKey = tuple[int, ...]
 
+# returned when no key is pending, so that case doesn't allocate
+EMPTY_KEY: TuiKey = ()
+
 def validate_keystr(key_str: str) -> str:
     '''Trim and validate key representation
 
@@ -45,6 +58,8 @@ def as_ctrl_key(key_str: str) -> TuiKey:
     Raise ValueError if key representation is invalid'''
     return (curses.ascii.ctrl(ord(validate_keystr(key_str))),)
 
+# the same few keys are converted on every key press while typing
+@lru_cache(maxsize = 512)
 def key_to_str(key: TuiKey) -> str:
     '''Convert TuiKey to printable string'''
     if len(key) == 1:
@@ -69,8 +84,17 @@ class TuiContext:
         self.is_running: bool = False
         self.draw_stack: list[Callable[[TuiContext], None]] = []
         self.variables: dict[str, Any] = {}
-        self.callbacks: dict[str, list[Callable[[Self, TuiKey], bool]]] = {}
-        self.event_queue: list[str] = []
+        # key events are by far the most common, so their stack is also kept
+        # as an attribute to skip the dict lookup
+        self.key_callbacks: deque[Callable[[Self, TuiKey], bool]] = deque()
+        self.callbacks: dict[str, deque[Callable[[Self, TuiKey], bool]]] = {
+                TUI_KEY_EVENT: self.key_callbacks }
+        # (event_type, callback) pairs in the stacks, to check for duplicates
+        self.registered_callbacks: set[tuple[str, Callable[[Self, TuiKey], bool]]] = set()
+        self.event_queue: deque[str] = deque()
+
+        # cached result of getmaxyx; cleared when the terminal is resized
+        self._screen_size: tuple[int, int] | None = None
 
         self._initialise_tui()
 
@@ -82,24 +106,28 @@ class TuiContext:
         # set nodelay mode
         self.stdscr.nodelay(True)
 
-        # use default colours
-        curses.use_default_colors()
+        # colour calls fail on terminals without colour support
+        if curses.has_colors():
+            curses.start_color()
+
+            # use default colours
+            curses.use_default_colors()
+
+            # define application colours, as far as the terminal has pairs
+            for pair_number, (fg, bg) in enumerate(TUI_COLOUR_PAIRS, 1):
+                if pair_number < curses.COLOR_PAIRS:
+                    curses.init_pair(pair_number, fg, bg)
 
         # clear and refresh on initialisation
         self.stdscr.clear()
         self.stdscr.refresh()
 
-        # define application colours NOTE: hardcoded for now
-        # NOTE currently disabled
-        #curses.start_color()
-        #curses.init_pair(1, curses.COLOR_CYAN, curses.COLOR_BLACK)
-        #curses.init_pair(2, curses.COLOR_RED, curses.COLOR_BLACK)
-        #curses.init_pair(3, curses.COLOR_BLACK, curses.COLOR_WHITE)
-
     @property
     def screen_size(self) -> tuple[int, int]:
         '''Get maxy,maxx for the TUI'''
-        return self.stdscr.getmaxyx()
+        if self._screen_size is None:
+            self._screen_size = self.stdscr.getmaxyx()
+        return self._screen_size
 
     def add_variable(self, name: str, initial_value: Any) -> bool:
         '''Create a TUI variable; Return False if variable already exists'''
@@ -114,7 +142,7 @@ class TuiContext:
 
     def set_variable(self, name: str, value: Any) -> TuiVariableResultErr:
         '''Set the value of a TUI variable; Return success state'''
-        if name not in self.variables.keys():
+        if name not in self.variables:
             return TuiVariableResultErr.VariableDoesExist
 
         cur_val = self.variables[name]
@@ -126,7 +154,7 @@ class TuiContext:
 
     def destroy_variable(self, name: str):
         '''Remove TUI variable'''
-        if name in self.variables.keys():
+        if name in self.variables:
             del self.variables[name]
 
     def add_callback(self, event_type: str, callback: Callable[[Self, TuiKey], bool]) -> bool:
@@ -145,25 +173,26 @@ class TuiContext:
 
         Return False if callback was previously added for this event type'''
 
+        registration = (event_type, callback)
+        if registration in self.registered_callbacks:
+            return False
+        self.registered_callbacks.add(registration)
+
         callback_stack = self.callbacks.get(event_type, None)
         if callback_stack is None:
-            callback_stack = [ callback ]
-            self.callbacks[event_type] = callback_stack
+            self.callbacks[event_type] = deque((callback,))
             return True
 
-        if callback in callback_stack:
-            return False
-
-        callback_stack.insert(0, callback)
+        callback_stack.appendleft(callback)
         return True
 
     def remove_callback(self, event_type: str, callback: Callable[[Self, TuiKey], bool]):
         '''Remove registered callback handler'''
-        callback_stack = self.callbacks.get(event_type, None)
-        if callback_stack is None:
+        registration = (event_type, callback)
+        if registration not in self.registered_callbacks:
             return
-        if callback in callback_stack:
-            callback_stack.remove(callback)
+        self.registered_callbacks.remove(registration)
+        self.callbacks[event_type].remove(callback)
 
     def begin_draw(self):
         '''Prepare TUI context for drawing the next screen state'''
@@ -192,31 +221,47 @@ class TuiContext:
 
     def move_cursor(self, x: int, y: int):
         '''Move cursor to position'''
-        maxy, maxx = self.stdscr.getmaxyx()
-        if x >= 0 and x <= maxx and y >= 0 and y <= maxy:
+        maxy, maxx = self.screen_size
+        if 0 <= x < maxx and 0 <= y < maxy:
             self.stdscr.move(y, x)
 
-    def _process_event_callback(self, key: TuiKey, stack: list[Callable[[Self, TuiKey], bool]]):
+    def _process_event_callback(self, key: TuiKey, stack: deque[Callable[[Self, TuiKey], bool]]):
         '''Process event callback'''
-        for callback in stack:
+        # iterate over a snapshot since callbacks may add or remove callbacks
+        # for this event, which a deque doesn't allow during iteration
+        for callback in tuple(stack):
             do_next = callback(self, key)
             if not do_next:
                 break
 
     def _process_event_queue(self, key: TuiKey):
         '''Process event queue'''
-        while len(self.event_queue) != 0:
-            event_type = self.event_queue.pop(0)
-            callback_stack = self.callbacks.get(event_type, None)
+        callbacks_get = self.callbacks.get
+        while self.event_queue:
+            event_type = self.event_queue.popleft()
+            if event_type is TUI_KEY_EVENT:
+                callback_stack = self.key_callbacks
+            else:
+                callback_stack = callbacks_get(event_type)
             if callback_stack is None:
                 continue
 
             self._process_event_callback(key, callback_stack)
 
-    def _get_key(self) -> TuiKey:
-        '''Get key from typeahead'''
+    def _get_key(self, wait: bool = True) -> TuiKey:
+        '''Get key from typeahead, waiting for the first byte if wait is set'''
+        if wait:
+            # sleep until input arrives instead of polling, then go back to
+            # nodelay mode to drain the rest of a multi-byte key
+            self.stdscr.nodelay(False)
+            key = self.stdscr.getch()
+            self.stdscr.nodelay(True)
+        else:
+            key = self.stdscr.getch()
+        if key == -1:
+            return EMPTY_KEY
+
         key_bytes: list[int] = []
-        key = self.stdscr.getch()
         while key != -1:
             key_bytes.append(key)
             key = self.stdscr.getch()
@@ -227,8 +272,13 @@ class TuiContext:
         '''Run mainloop for handling user input'''
         self.is_running = True
         while self.is_running:
-            key = self._get_key()
-            if len(key) != 0:
+            # events emitted outside of the loop (e.g. while creating screen
+            # bindings) must be handled without waiting for a key
+            key = self._get_key(wait = not self.event_queue)
+            if curses.KEY_RESIZE in key:
+                self._screen_size = None
+
+            if key:
                 self.event_queue.append(TUI_KEY_EVENT)
 
             self._process_event_queue(key)
@@ -249,9 +299,11 @@ class AcceleratorMap:
         self.key_map: dict[TuiKey, Callable[[TuiContext], None]] = {}
         if key_map is not None:
             self.key_map = { **self.key_map, **key_map }
+        # bound once as it is called for every key press
+        self._key_map_get = self.key_map.get
 
     def on_key_press(self, t: TuiContext, key: TuiKey) -> bool:
-        callback = self.key_map.get(key, None)
+        callback = self._key_map_get(key)
         if callback is not None:
             callback(t)
             return False    # prevent further propagation that might be unexpected
@@ -268,7 +320,7 @@ class AcceleratorMap:
 
     def map_key(self, key: TuiKey, callback: Callable[[TuiContext], None]) -> bool:
         '''Map a key to a callback; Return False if mapping already exists'''
-        if key in self.key_map.keys():
+        if key in self.key_map:
             return False
 
         self.key_map[key] = callback
@@ -279,7 +331,7 @@ class AcceleratorMap:
                  ) -> bool:
         '''Attempt to map all provided keys to a callback. Return False if any
         mapping fails and do not set any of the mappings'''
-        if any(key in self.key_map.keys() for key in keys):
+        if any(key in self.key_map for key in keys):
             return False
 
         for key in keys:
@@ -295,6 +347,10 @@ class RenderTarget:
     post_render_fn: Callable[[int, int], None] = POST_DO_NOTHING
     start_x: int = -1
     start_y: int = -1
+    height: int = 0
+    width: int = 0
+    # width of text that never changes; -1 if it is measured on each draw
+    static_width: int = -1
 
 class Layout:
     def __init__(
@@ -315,6 +371,10 @@ class Layout:
         self.offset_y: int = 0
         self.items: list[RenderTarget] = []
 
+        # screen size and (x, y, width, height) of the last full draw
+        self._drawn_screen_size: tuple[int, int] | None = None
+        self._drawn_region: tuple[int, int, int, int] = (0, 0, 0, 0)
+
     def add_to_tui(self, tui: TuiContext):
         '''Add to Tui'''
         tui.draw_stack.append(self.on_draw)
@@ -329,7 +389,12 @@ class Layout:
 
             item.start_y = len(lines)
             text = item.text_render_fn()
-            width = max(len(line) for line in text)
+            item.height = len(text)
+            if item.static_width >= 0:
+                width = item.static_width
+            else:
+                width = max(map(len, text))
+            item.width = width
             max_width = max(width, max_width)
             lines.extend(text)
 
@@ -351,14 +416,57 @@ class Layout:
         else:
             start_x = 0
 
+        # every line goes straight to curses rather than through draw_text;
+        # addnstr clips to the width without slicing each line
+        addnstr = t.stdscr.addnstr
         for index, line in enumerate(lines[:height]):
-            t.draw_text(line[:width], start_x, start_y + index)
+            addnstr(start_y + index, start_x, line, width)
 
         for item in self.items:
             item.start_y += start_y
             item.start_x = start_x
             item.post_render_fn(item.start_x, item.start_y)
 
+        self._drawn_screen_size = (screen_height, screen_width)
+        self._drawn_region = (start_x, start_y, width, height)
+
+    def redraw_target(self, t: TuiContext, target: RenderTarget) -> bool:
+        '''Redraw only the lines of a target that has changed
+
+        Return False if the change would move or resize the layout, in which
+        case the whole screen has to be redrawn instead'''
+        if self._drawn_screen_size != t.screen_size:
+            return False
+
+        start_x, start_y, width, height = self._drawn_region
+        text = target.text_render_fn()
+        if (len(text) != target.height
+                or target.start_y + len(text) > start_y + height):
+            return False
+
+        # the layout is as wide as its widest item, so the target growing or
+        # shrinking can change the width that on_draw would centre with
+        if target.static_width >= 0:
+            target_width = target.static_width
+        else:
+            target_width = max(map(len, text))
+        if target_width != target.width:
+            new_width = max(
+                    self._min_width,
+                    target_width,
+                    *(item.width for item in self.items if item is not target))
+            if min(new_width, self._drawn_screen_size[1]) != width:
+                return False
+            target.width = target_width
+
+        # pad to the layout width to overwrite what was there before, and clip
+        # like on_draw does when the screen is narrower than the layout
+        for index, line in enumerate(text):
+            t.draw_text(line.ljust(width)[:width], start_x, target.start_y + index)
+
+        target.post_render_fn(target.start_x, target.start_y)
+        return True
+
     @property
     def centered_x(self) -> bool:
         return self._centered_x
@@ -403,7 +511,7 @@ class Layout:
 
     def add_text(self, text: str) -> RenderTarget:
         '''Add text to layout renderer'''
-        target = RenderTarget(lambda: (text, ))
+        target = RenderTarget(lambda: (text, ), static_width=len(text))
         self.items.append(target)
         return target
 
@@ -432,6 +540,7 @@ class CheckboxMenu:
     def initialise_target(self):
         self.button_cursor_pairs: list[tuple[CheckboxMenuEntry, tuple[int, int]]] = []
         self.lines: list[str] = []
+        self.dirty: bool = True   # lines need rebuilding before the next render
         self.target = RenderTarget(
                 text_render_fn=self.on_render,
                 post_render_fn=self.on_post_render)
@@ -444,20 +553,32 @@ class CheckboxMenu:
         '''Add entry to checkbox menu'''
         entry = CheckboxMenuEntry(text, enabled=enabled)
         self.entries.append(entry)
+        self.dirty = True
         return entry
 
-    def on_render(self) -> list[str]:
-        self.button_cursor_pairs.clear()
-        self.lines.clear()
+    def toggle_entry(self, index: int) -> CheckboxMenuEntry:
+        '''Toggle entry at index, updating only its rendered line'''
+        entry = self.entries[index]
+        entry.enabled = not entry.enabled
+        if not self.dirty:
+            title_offset = 0 if self.title is None else 1
+            self.lines[index + title_offset] = self.render_entry(entry)
+        return entry
 
-        if self.title is not None:
-            self.lines.append(self.title)
+    def render_entry(self, entry: CheckboxMenuEntry) -> str:
+        '''Render line for entry'''
+        return (TUI_CHECKBOX_ON if entry.enabled else TUI_CHECKBOX_OFF) + entry.text
 
-        for index, entry in enumerate(self.entries):
-            button = "[X]" if entry.enabled else "[ ]"
-            self.lines.append(f"{button} {entry.text}")
-            self.button_cursor_pairs.append((entry, (1, index + 1)))
+    def on_render(self) -> list[str]:
+        if not self.dirty:
+            return self.lines
 
+        title_lines = [] if self.title is None else [self.title]
+        self.lines = title_lines + [self.render_entry(entry) for entry in self.entries]
+        self.button_cursor_pairs = [
+                (entry, (1, index + 1)) for index, entry in enumerate(self.entries)]
+
+        self.dirty = False
         return self.lines
 
     def on_post_render(self, x: int, y: int):
@@ -581,17 +702,17 @@ class TuiProgram:
 
         # NOTE this is temporary patch to allow branching state
         # TODO implement event data
-        if "next_state_override" in self.prog_data.keys():
+        if "next_state_override" in self.prog_data:
             self.state = self.prog_data["next_state_override"]
             del self.prog_data["next_state_override"]
         else:
-            assert self.state in self.screens.keys()
+            assert self.state in self.screens
             self.state = self.screens[self.state].next_state
 
         if self.state == TUI_END_STATE:
             self.screen = None
             t.pause()
-        elif self.state not in self.screens.keys():
+        elif self.state not in self.screens:
             raise RuntimeError(f"Unknown state after {type(self.screen)}: {self.state}")
         else:
             self.screen = self.screens[self.state].screen_type(self.prog_data)
@@ -605,7 +726,7 @@ class TuiProgram:
         '''Run the program, returning after program enters TUI_END_STATE
 
         Raise RuntimeError if state is unknown'''
-        if self.state not in self.screens.keys():
+        if self.state not in self.screens:
             raise RuntimeError(f"Unknown state: {self.state}")
 
         self.screen = self.screens[self.state].screen_type(self.prog_data)
@@ -638,6 +759,8 @@ class MenuScreen(ScreenBase):
             self.menu.add_entry(item_display_fn(item))
 
         self.menu.selected_index = start_index
+        # items don't change once the menu is built
+        self.max_index = len(items) - 1
 
     def draw(self, tui: TuiContext) -> None:
         '''Draw calls to render menu'''
@@ -668,19 +791,17 @@ class MenuScreen(ScreenBase):
         self.accel_map.remove_from_tui(tui)
         self.prog_data["selection"] = self.items[self.menu.selected_index]
 
-    def get_bounded_selection_index(self, index: int) -> int:
-        '''Return the bounded index in menu entries'''
-        index = max(0, index)
-        index = min(len(self.menu.entries) - 1, index)
-        return index
-
     def on_down(self, t: TuiContext):
-        index = self.get_bounded_selection_index(self.menu.selected_index + 1)
+        index = self.menu.selected_index + 1
+        if index > self.max_index:
+            index = self.max_index
         self.menu.selected_index = index
         t.move_cursor(*self.menu.entries[index].rendered_cursor_pos)
 
     def on_up(self, t: TuiContext):
-        index = self.get_bounded_selection_index(self.menu.selected_index - 1)
+        index = self.menu.selected_index - 1
+        if index < 0:
+            index = 0
         self.menu.selected_index = index
         t.move_cursor(*self.menu.entries[index].rendered_cursor_pos)
 